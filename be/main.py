@@ -3,18 +3,26 @@ from multiprocessing import process
 from prometheus_fastapi_instrumentator import Instrumentator
 from fastapi import FastAPI, HTTPException, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, TypedDict
 from datetime import datetime
-import requests
+import httpx
+import orjson
+from cachetools import TTLCache
+import numpy as np
+from numba import njit
 import pandas as pd
 import io
-import psycopg2
-from psycopg2.extras import execute_values
+import time
+import xxhash
+import asyncio
+from psycopg2.pool import ThreadedConnectionPool
+import threading
 from contextlib import contextmanager
 
-app = FastAPI(title="Currency Exchange Rate API")
+app = FastAPI(title="Currency Exchange Rate API", default_response_class=ORJSONResponse)
 Instrumentator().instrument(app).expose(app)
 
 app.add_middleware(
@@ -25,6 +33,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large exchange-rate payloads
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Database configuration
 DB_CONFIG = {
     "host": os.getenv("DB_CONFIG_HOST"),
@@ -34,21 +45,101 @@ DB_CONFIG = {
     "port": os.getenv("DB_CONFIG_PORT")
 }
 
+# Uploads smaller than this are inserted with a single UNNEST statement;
+# larger ones go through COPY into a staging table
+COPY_MIN_ROWS = 5000
+# Approximate number of rows sent per COPY chunk
+COPY_CHUNK_ROWS = 50000
+
+# Rows fetched per round trip when reading history through a server-side cursor
+HISTORY_FETCH_SIZE = 10000
+
+# Rates are stored exactly as parsed, at the DECIMAL(18, 6) scale of the database column
+RATE_DECIMALS = 6
+# Copies used only for statistics and responses are held as float32, and response
+# values are rounded to the significant digits float32 can represent
+RATE_DTYPE = 'float32'
+RATE_SIGNIFICANT_DIGITS = 7
+
+# Shared HTTP client for the Frankfurter API; keeps connections alive between
+# requests and retries failed connection attempts
+http_client = httpx.AsyncClient(
+    timeout=30,
+    follow_redirects=True,
+    transport=httpx.AsyncHTTPTransport(
+        retries=3,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+    )
+)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close the shared HTTP client"""
+    await http_client.aclose()
+
+# In-process caches for Frankfurter responses. Entries are (fetched_at, etag, value);
+# they are served directly while fresh and revalidated with If-None-Match after that,
+# until the cache itself evicts them
+RATES_CACHE = TTLCache(maxsize=1024, ttl=86400)
+RATES_FRESH_SECONDS = 3600
+CURRENCIES_CACHE = TTLCache(maxsize=1, ttl=7 * 86400)
+CURRENCIES_FRESH_SECONDS = 86400
+
+async def frankfurter_get(url: str, params: Optional[dict] = None, etag: Optional[str] = None, **kwargs):
+    """
+    GET a Frankfurter endpoint, revalidating with If-None-Match when an ETag is given.
+    Returns (status_code, json_data, etag); json_data is only set for a 200
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    
+    response = await http_client.get(url, params=params, headers=headers, **kwargs)
+    
+    if response.status_code != 200:
+        return response.status_code, None, etag
+    return 200, response.json(), response.headers.get("ETag")
+
+# Connection pool, created on first use so the API can start before the database is up
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+db_pool = None
+db_pool_lock = threading.Lock()
+# getconn() raises once every connection is checked out, so callers wait on a slot first
+db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+def get_db_pool():
+    """Return the shared connection pool, creating it if needed"""
+    global db_pool
+    if db_pool is None:
+        with db_pool_lock:
+            if db_pool is None:
+                db_pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+    return db_pool
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections"""
-    conn = None
+    """Context manager for pooled database connections"""
+    pool = get_db_pool()
+    db_pool_slots.acquire()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        yield conn
-        conn.commit()
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        raise e
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            if not conn.closed:
+                conn.rollback()
+            raise e
+        finally:
+            # Discard connections that were closed underneath us
+            pool.putconn(conn, close=bool(conn.closed))
     finally:
-        if conn:
-            conn.close()
+        db_pool_slots.release()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    """Close all pooled connections"""
+    if db_pool is not None:
+        db_pool.closeall()
 
 def init_database():
     """Initialize database tables"""
@@ -74,6 +165,18 @@ def init_database():
                 ON exchange_rates(date, currency)
             """)
             
+            # Per-currency date range lookups
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_er_currency_date
+                ON exchange_rates(currency, date)
+            """)
+            
+            # Compact block-range index for date range scans on large tables
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_er_date_brin
+                ON exchange_rates USING BRIN (date) WITH (pages_per_range = 32)
+            """)
+            
             # Create uploads table to track CSV uploads
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS csv_uploads (
@@ -82,10 +185,20 @@ def init_database():
                     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     records_count INTEGER,
                     date_range_start DATE,
-                    date_range_end DATE
+                    date_range_end DATE,
+                    content_hash CHAR(16)
                 )
             """)
             
+            # Content hash of each stored upload, used to skip identical re-uploads
+            cursor.execute("""
+                ALTER TABLE csv_uploads ADD COLUMN IF NOT EXISTS content_hash CHAR(16)
+            """)
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_csv_uploads_content_hash
+                ON csv_uploads(content_hash)
+            """)
+            
             cursor.close()
             print("Database initialized successfully")
     except Exception as e:
@@ -100,7 +213,8 @@ class CurrencyRequest(BaseModel):
     end_date: str = Field(..., description="End date in YYYY-MM-DD format")
     interval: str = Field(default="1d", description="Data interval: 1d, 1wk, 1mo")
 
-class CurrencyData(BaseModel):
+# Response payloads are output-only, so they are plain dicts rather than validated models
+class CurrencyData(TypedDict):
     currency: str
     dates: List[str]
     rates: List[float]
@@ -110,11 +224,27 @@ class CurrencyData(BaseModel):
     min_rate: float
     max_rate: float
 
-class CurrencyResponse(BaseModel):
+class CurrencyResponse(TypedDict):
     data: List[CurrencyData]
     status: str
-    message: Optional[str] = None
-    errors: Optional[List[str]] = None
+    message: Optional[str]
+    errors: Optional[List[str]]
+
+def frame_content_hash(df: pd.DataFrame) -> str:
+    """xxh64 digest of a rates frame's dates, currencies and values"""
+    digest = xxhash.xxh64()
+    digest.update(df.index.values.astype('datetime64[D]').tobytes())
+    digest.update(",".join(map(str, df.columns)).encode('utf-8'))
+    # Hash the full-precision values that get stored, not a float32 copy
+    digest.update(np.ascontiguousarray(df.to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+def stack_rates(df: pd.DataFrame) -> pd.DataFrame:
+    """Flatten a rates frame to (date, currency, rate) rows; stack() drops missing rates"""
+    long_df = df.stack().rename('rate').reset_index()
+    long_df.columns = ['date', 'currency', 'rate']
+    long_df['date'] = long_df['date'].dt.strftime('%Y-%m-%d')
+    return long_df
 
 def store_exchange_rates_in_db(df: pd.DataFrame, filename: str = "api_data"):
     """Store exchange rate data in PostgreSQL database"""
@@ -122,45 +252,89 @@ def store_exchange_rates_in_db(df: pd.DataFrame, filename: str = "api_data"):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Prepare data for insertion
-            data_to_insert = []
-            for date_idx in df.index:
-                for currency in df.columns:
-                    rate = df.loc[date_idx, currency]
-                    if pd.notna(rate):
-                        data_to_insert.append((
-                            date_idx.strftime('%Y-%m-%d'),
-                            currency,
-                            float(rate)
-                        ))
+            records_count = int(df.count().sum())
+            if records_count == 0:
+                return False
             
-            if data_to_insert:
-                # Insert data using ON CONFLICT to handle duplicates
-                execute_values(
-                    cursor,
-                    """
+            min_date = df.index.min().strftime('%Y-%m-%d')
+            max_date = df.index.max().strftime('%Y-%m-%d')
+            
+            # Serialize stores so the hash check, upsert and hash reset below see
+            # each other's committed results; held until this transaction ends
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('csv_uploads'))")
+            
+            # Skip the upsert when identical content was stored and no later
+            # upload has touched its date range since (see the hash reset below)
+            content_hash = frame_content_hash(df)
+            cursor.execute("SELECT 1 FROM csv_uploads WHERE content_hash = %s", (content_hash,))
+            if cursor.fetchone():
+                cursor.execute("""
+                    INSERT INTO csv_uploads (filename, records_count, date_range_start, date_range_end)
+                    VALUES (%s, 0, %s, %s)
+                """, (filename, min_date, max_date))
+                
+                cursor.close()
+                print(f"Skipped storing {filename}: identical data already in database")
+                return False
+            
+            if records_count < COPY_MIN_ROWS:
+                # Small batch: send the columns as three arrays in one statement
+                long_df = stack_rates(df)
+                cursor.execute("""
                     INSERT INTO exchange_rates (date, currency, rate)
-                    VALUES %s
+                    SELECT * FROM unnest(%s::date[], %s::varchar[], %s::numeric[])
                     ON CONFLICT (date, currency) 
                     DO UPDATE SET rate = EXCLUDED.rate
-                    """,
-                    data_to_insert
-                )
+                """, (
+                    long_df['date'].tolist(),
+                    long_df['currency'].tolist(),
+                    long_df['rate'].astype('float64').round(RATE_DECIMALS).tolist()
+                ))
+            else:
+                # Stream rows into a staging table with COPY
+                cursor.execute("""
+                    CREATE TEMP TABLE _stage (
+                        date DATE,
+                        currency VARCHAR(10),
+                        rate DECIMAL(18, 6)
+                    ) ON COMMIT DROP
+                """)
                 
-                # Log upload
-                min_date = df.index.min().strftime('%Y-%m-%d')
-                max_date = df.index.max().strftime('%Y-%m-%d')
+                # Flatten and copy one block of dates at a time so only
+                # about COPY_CHUNK_ROWS rows are held as text at once
+                dates_per_chunk = max(1, COPY_CHUNK_ROWS // len(df.columns))
+                for start in range(0, len(df), dates_per_chunk):
+                    long_df = stack_rates(df.iloc[start:start + dates_per_chunk])
+                    buf = io.StringIO()
+                    long_df.to_csv(buf, index=False, header=False, float_format=f'%.{RATE_DECIMALS}f')
+                    buf.seek(0)
+                    cursor.copy_expert("COPY _stage FROM STDIN WITH CSV", buf)
                 
+                # Merge staged rows using ON CONFLICT to handle duplicates
                 cursor.execute("""
-                    INSERT INTO csv_uploads (filename, records_count, date_range_start, date_range_end)
-                    VALUES (%s, %s, %s, %s)
-                """, (filename, len(data_to_insert), min_date, max_date))
-                
-                cursor.close()
-                print(f"Stored {len(data_to_insert)} records in database")
-                # print(data_to_insert[:5])  
-                return True
-            return False
+                    INSERT INTO exchange_rates (date, currency, rate)
+                    SELECT date, currency, rate FROM _stage
+                    ON CONFLICT (date, currency) 
+                    DO UPDATE SET rate = EXCLUDED.rate
+                """)
+            
+            # Earlier uploads overlapping this date range may no longer match the
+            # database, so re-sending them must not be skipped as a no-op
+            cursor.execute("""
+                UPDATE csv_uploads SET content_hash = NULL
+                WHERE content_hash IS NOT NULL
+                AND date_range_start <= %s AND date_range_end >= %s
+            """, (max_date, min_date))
+            
+            # Log upload
+            cursor.execute("""
+                INSERT INTO csv_uploads (filename, records_count, date_range_start, date_range_end, content_hash)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (filename, records_count, min_date, max_date, content_hash))
+            
+            cursor.close()
+            print(f"Stored {records_count} records in database")
+            return True
     except Exception as e:
         print(f"Error storing data in database: {str(e)}")
         raise e
@@ -170,26 +344,33 @@ def get_exchange_rates_from_db(currencies: List[str], start_date: str, end_date:
     try:
         with get_db_connection() as conn:
             query = """
-                SELECT date, currency, rate
+                SELECT date, currency, rate::float8
                 FROM exchange_rates
                 WHERE currency IN %s
                 AND date BETWEEN %s AND %s
                 ORDER BY date, currency
             """
             
-            df = pd.read_sql_query(
-                query,
-                conn,
-                params=(tuple(currencies), start_date, end_date)
-            )
+            # Server-side cursor so only one batch of tuples is held in memory at a time
+            chunks = []
+            with conn.cursor(name='history_cur') as cursor:
+                cursor.itersize = HISTORY_FETCH_SIZE
+                cursor.execute(query, (tuple(currencies), start_date, end_date))
+                while True:
+                    rows = cursor.fetchmany(HISTORY_FETCH_SIZE)
+                    if not rows:
+                        break
+                    chunks.append(pd.DataFrame.from_records(rows, columns=['date', 'currency', 'rate']))
             
-            if df.empty:
+            if not chunks:
                 return pd.DataFrame()
             
-            # Pivot to get currencies as columns
+            df = pd.concat(chunks, ignore_index=True)
+            
+            # Reshape to currencies as columns; rows are unique and already ordered by the query
             df['date'] = pd.to_datetime(df['date'])
-            pivot_df = df.pivot(index='date', columns='currency', values='rate')
-            pivot_df = pivot_df.sort_index()
+            pivot_df = df.set_index(['date', 'currency'])['rate'].unstack('currency')
+            pivot_df = pivot_df.astype(RATE_DTYPE, copy=False)
             
             print(f"Retrieved {len(pivot_df)} rows from database")
             return pivot_df
@@ -197,126 +378,145 @@ def get_exchange_rates_from_db(currencies: List[str], start_date: str, end_date:
         print(f"Error retrieving data from database: {str(e)}")
         return pd.DataFrame()
 
+# Root payload never changes, so serialize it once
+ROOT_BODY = orjson.dumps({
+    "message": "Currency Exchange Rate API",
+    "version": "4.0",
+    "data_source": "Frankfurter API (European Central Bank)",
+    "endpoints": {
+        "/currencies": "GET - List available currencies",
+        "/exchange-rates": "POST - Get historical exchange rates",
+        "/analyze-csv": "POST - Upload and analyze CSV (stores in database)",
+        "/download-template": "GET - Download CSV template",
+        "/db-stats": "GET - Database statistics"
+    }
+})
+
 @app.get("/")
 def read_root():
-    return {
-        "message": "Currency Exchange Rate API",
-        "version": "4.0",
-        "data_source": "Frankfurter API (European Central Bank)",
-        "endpoints": {
-            "/currencies": "GET - List available currencies",
-            "/exchange-rates": "POST - Get historical exchange rates",
-            "/analyze-csv": "POST - Upload and analyze CSV (stores in database)",
-            "/download-template": "GET - Download CSV template",
-            "/db-stats": "GET - Database statistics"
+    return Response(ROOT_BODY, media_type="application/json")
+
+def query_db_stats():
+    """Collect database statistics"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Total records, unique currencies and date range in one scan
+        cursor.execute("""
+            SELECT COUNT(*), COUNT(DISTINCT currency), MIN(date), MAX(date)
+            FROM exchange_rates
+        """)
+        total_records, unique_currencies, *date_range = cursor.fetchone()
+        
+        # Recent uploads
+        cursor.execute("""
+            SELECT filename, upload_date, records_count 
+            FROM csv_uploads 
+            ORDER BY upload_date DESC 
+            LIMIT 5
+        """)
+        recent_uploads = cursor.fetchall()
+        
+        cursor.close()
+        
+        return {
+            "total_records": total_records,
+            "unique_currencies": unique_currencies,
+            "date_range": {
+                "start": str(date_range[0]) if date_range[0] else None,
+                "end": str(date_range[1]) if date_range[1] else None
+            },
+            "recent_uploads": [
+                {
+                    "filename": upload[0],
+                    "upload_date": str(upload[1]),
+                    "records_count": upload[2]
+                }
+                for upload in recent_uploads
+            ]
         }
-    }
 
 @app.get("/db-stats")
-def get_db_stats():
+async def get_db_stats():
     """Get database statistics"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Total records
-            cursor.execute("SELECT COUNT(*) FROM exchange_rates")
-            total_records = cursor.fetchone()[0]
-            
-            # Unique currencies
-            cursor.execute("SELECT COUNT(DISTINCT currency) FROM exchange_rates")
-            unique_currencies = cursor.fetchone()[0]
-            
-            # Date range
-            cursor.execute("SELECT MIN(date), MAX(date) FROM exchange_rates")
-            date_range = cursor.fetchone()
-            
-            # Recent uploads
-            cursor.execute("""
-                SELECT filename, upload_date, records_count 
-                FROM csv_uploads 
-                ORDER BY upload_date DESC 
-                LIMIT 5
-            """)
-            recent_uploads = cursor.fetchall()
-            
-            cursor.close()
-            
-            return {
-                "total_records": total_records,
-                "unique_currencies": unique_currencies,
-                "date_range": {
-                    "start": str(date_range[0]) if date_range[0] else None,
-                    "end": str(date_range[1]) if date_range[1] else None
-                },
-                "recent_uploads": [
-                    {
-                        "filename": upload[0],
-                        "upload_date": str(upload[1]),
-                        "records_count": upload[2]
-                    }
-                    for upload in recent_uploads
-                ]
-            }
+        return await asyncio.to_thread(query_db_stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+# Fallback currency list if API fails
+FALLBACK_CURRENCIES = {
+    "AUD": "Australian Dollar",
+    "BGN": "Bulgarian Lev",
+    "BRL": "Brazilian Real",
+    "CAD": "Canadian Dollar",
+    "CHF": "Swiss Franc",
+    "CNY": "Chinese Yuan",
+    "CZK": "Czech Koruna",
+    "DKK": "Danish Krone",
+    "EUR": "Euro",
+    "GBP": "British Pound",
+    "HKD": "Hong Kong Dollar",
+    "HUF": "Hungarian Forint",
+    "IDR": "Indonesian Rupiah",
+    "ILS": "Israeli Shekel",
+    "INR": "Indian Rupee",
+    "ISK": "Icelandic Krona",
+    "JPY": "Japanese Yen",
+    "KRW": "South Korean Won",
+    "MXN": "Mexican Peso",
+    "MYR": "Malaysian Ringgit",
+    "NOK": "Norwegian Krone",
+    "NZD": "New Zealand Dollar",
+    "PHP": "Philippine Peso",
+    "PLN": "Polish Zloty",
+    "RON": "Romanian Leu",
+    "SEK": "Swedish Krona",
+    "SGD": "Singapore Dollar",
+    "THB": "Thai Baht",
+    "TRY": "Turkish Lira",
+    "ZAR": "South African Rand"
+}
+
 @app.get("/currencies")
-def get_currencies():
+async def get_currencies():
     """Return list of supported currencies from Frankfurter API"""
+    cached = CURRENCIES_CACHE.get("currencies")
+    if cached and time.monotonic() - cached[0] < CURRENCIES_FRESH_SECONDS:
+        return {"currencies": cached[2]}
+    
     try:
-        response = requests.get("https://api.frankfurter.app/currencies", timeout=10)
-        if response.status_code == 200:
-            currencies = response.json()
+        status_code, data, etag = await frankfurter_get(
+            "https://api.frankfurter.app/currencies",
+            etag=cached[1] if cached else None,
+            timeout=10
+        )
+        if status_code == 304 and cached:
+            CURRENCIES_CACHE["currencies"] = (time.monotonic(), cached[1], cached[2])
+            return {"currencies": cached[2]}
+        if status_code == 200:
+            currencies = data
             currencies.pop("USD", None)
             print(currencies)
+            CURRENCIES_CACHE["currencies"] = (time.monotonic(), etag, currencies)
             return {"currencies": currencies}
         else:
             # Fallback list
-            return {"currencies": get_fallback_currencies()}
+            return {"currencies": FALLBACK_CURRENCIES}
     except Exception as e:
         print(f"Error fetching currencies: {str(e)}")
-        return {"currencies": get_fallback_currencies()}
-
-def get_fallback_currencies():
-    """Fallback currency list if API fails"""
-    return {
-        "AUD": "Australian Dollar",
-        "BGN": "Bulgarian Lev",
-        "BRL": "Brazilian Real",
-        "CAD": "Canadian Dollar",
-        "CHF": "Swiss Franc",
-        "CNY": "Chinese Yuan",
-        "CZK": "Czech Koruna",
-        "DKK": "Danish Krone",
-        "EUR": "Euro",
-        "GBP": "British Pound",
-        "HKD": "Hong Kong Dollar",
-        "HUF": "Hungarian Forint",
-        "IDR": "Indonesian Rupiah",
-        "ILS": "Israeli Shekel",
-        "INR": "Indian Rupee",
-        "ISK": "Icelandic Krona",
-        "JPY": "Japanese Yen",
-        "KRW": "South Korean Won",
-        "MXN": "Mexican Peso",
-        "MYR": "Malaysian Ringgit",
-        "NOK": "Norwegian Krone",
-        "NZD": "New Zealand Dollar",
-        "PHP": "Philippine Peso",
-        "PLN": "Polish Zloty",
-        "RON": "Romanian Leu",
-        "SEK": "Swedish Krona",
-        "SGD": "Singapore Dollar",
-        "THB": "Thai Baht",
-        "TRY": "Turkish Lira",
-        "ZAR": "South African Rand"
-    }
+        return {"currencies": FALLBACK_CURRENCIES}
 
-def fetch_currency_data(currencies: List[str], start_date: str, end_date: str):
+async def fetch_currency_data(currencies: List[str], start_date: str, end_date: str):
     """
     Returns exchange rates with USD as base currency
     """
+    cache_key = (tuple(sorted(currencies)), start_date, end_date)
+    cached = RATES_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < RATES_FRESH_SECONDS:
+        print(f"Using cached data for {start_date}..{end_date}")
+        return cached[2]
+    
     try:
         url = f"https://api.frankfurter.app/{start_date}..{end_date}"
         
@@ -333,27 +533,32 @@ def fetch_currency_data(currencies: List[str], start_date: str, end_date: str):
         print(f"Parameters: {params}")
         
         # Make request to Frankfurter API
-        response = requests.get(url, params=params, timeout=30)
+        status_code, data, etag = await frankfurter_get(url, params=params, etag=cached[1] if cached else None)
+        
+        if status_code == 304 and cached:
+            print(f"Cached data for {start_date}..{end_date} is still current")
+            RATES_CACHE[cache_key] = (time.monotonic(), cached[1], cached[2])
+            return cached[2]
         
-        if response.status_code == 200:
-            data = response.json()
+        if status_code == 200:
             
             # Extract rates data
             if "rates" in data:
                 rates_data = data["rates"]
                 
                 # Convert to DataFrame
-                df = pd.DataFrame(rates_data).T
+                df = pd.DataFrame(rates_data).T.astype(RATE_DTYPE)
                 df.index = pd.to_datetime(df.index)
                 df = df.sort_index()
                 
                 print(f"Successfully fetched data: {len(df)} rows, {len(df.columns)} currencies")
+                RATES_CACHE[cache_key] = (time.monotonic(), etag, df)
                 return df
             else:
                 print("No 'rates' key in response")
                 return pd.DataFrame()
         else:
-            print(f"API Error: {response.status_code}")
+            print(f"API Error: {status_code}")
             return pd.DataFrame()
             
     except Exception as e:
@@ -379,9 +584,10 @@ def process_csv_data(df: pd.DataFrame, currencies: List[str], start_date: str, e
         # Filter by currencies
         df = df[df['Currency'].isin(currencies)]
         
-        # Pivot the data
-        pivot_df = df.pivot(index='Date', columns='Currency', values='Rate')
-        pivot_df = pivot_df.sort_index()
+        # Reshape to currencies as columns; later rows win for repeated (Date, Currency)
+        df = df.drop_duplicates(subset=['Date', 'Currency'], keep='last')
+        df = df.sort_values(['Date', 'Currency'])
+        pivot_df = df.set_index(['Date', 'Currency'])['Rate'].unstack('Currency')
         
         print(f"Processed CSV data: {len(pivot_df)} rows, {len(pivot_df.columns)} currencies")
         return pivot_df
@@ -389,48 +595,96 @@ def process_csv_data(df: pd.DataFrame, currencies: List[str], start_date: str, e
         print(f"Error processing CSV data: {str(e)}")
         raise e
 
+# Period frequency for each resampled interval; "1d" and unknown intervals pass through
+RESAMPLE_PERIODS = {
+    "1wk": "W",
+    "1mo": "M"
+}
+
 def resample_data(df: pd.DataFrame, interval: str) -> pd.DataFrame:
     """
     Resample data based on interval
     """
-    if df.empty:
-        return df
-    
-    if interval == "1d":
+    if df.empty or interval not in RESAMPLE_PERIODS:
         return df  # Daily data, no resampling needed
-    elif interval == "1wk":
-        return df.resample('W').last().dropna()
-    elif interval == "1mo":
-        return df.resample('M').last().dropna()  # 'ME' for month-end frequency
-    else:
-        return df
-
-def build_currency_response(df: pd.DataFrame, currencies: List[str]) -> CurrencyResponse:
+    
+    # Group on integer period codes (input is date-sorted) and label each
+    # group with its period end, matching resample(...).last()
+    resampled = df.groupby(df.index.to_period(RESAMPLE_PERIODS[interval]), sort=False).last().dropna()
+    resampled.index = resampled.index.to_timestamp(how='end').normalize()
+    return resampled
+
+def round_rates(values: np.ndarray) -> np.ndarray:
+    """Round rates to RATE_SIGNIFICANT_DIGITS, whatever their magnitude"""
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.floor(np.log10(np.abs(values), where=values != 0, out=np.zeros_like(values)))
+    scale = 10.0 ** (RATE_SIGNIFICANT_DIGITS - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+@njit(cache=True)
+def column_stats(values):
+    """
+    Start, end, min, max and count of the non-missing values in each column,
+    in one pass per column
+    """
+    n_rows, n_cols = values.shape
+    out = np.full((5, n_cols), np.nan)
+    for j in range(n_cols):
+        count = 0
+        for i in range(n_rows):
+            value = values[i, j]
+            if np.isnan(value):
+                continue
+            if count == 0:
+                out[0, j] = value
+                out[2, j] = value
+                out[3, j] = value
+            elif value < out[2, j]:
+                out[2, j] = value
+            elif value > out[3, j]:
+                out[3, j] = value
+            out[1, j] = value
+            count += 1
+        out[4, j] = count
+    return out
+
+def build_currency_response(df: pd.DataFrame, currencies: List[str], missing_reason: str = "Not available in data") -> CurrencyResponse:
     """Build response from DataFrame"""
     result_data = []
     failed_currencies = []
     
+    # Per-currency statistics and date labels computed once for the whole frame
+    values = column_stats(df.to_numpy(dtype=np.float32, na_value=np.nan))
+    values[:4] = round_rates(values[:4])
+    stats = pd.DataFrame(
+        values.T,
+        index=df.columns,
+        columns=["start", "end", "min", "max", "count"]
+    )
+    # Day-precision datetime64 casts straight to ISO "YYYY-MM-DD" strings
+    all_dates = df.index.values.astype('datetime64[D]').astype('U10')
+    
     for currency in currencies:
         try:
-            if currency not in df.columns:
-                failed_currencies.append(f"{currency} (Not available in data)")
+            if currency not in stats.index:
+                failed_currencies.append(f"{currency} ({missing_reason})")
                 print(f"Currency {currency} not in data")
                 continue
             
-            rates = df[currency].dropna()
-            
-            if len(rates) == 0:
+            if stats.at[currency, "count"] == 0:
                 failed_currencies.append(f"{currency} (Empty dataset)")
                 continue
             
-            start_rate = float(rates.iloc[0])
-            end_rate = float(rates.iloc[-1])
+            start_rate = float(stats.at[currency, "start"])
+            end_rate = float(stats.at[currency, "end"])
             percentage_change = ((end_rate - start_rate) / start_rate) * 100
-            min_rate = float(rates.min())
-            max_rate = float(rates.max())
+            min_rate = float(stats.at[currency, "min"])
+            max_rate = float(stats.at[currency, "max"])
             
-            dates = [date.strftime("%Y-%m-%d") for date in rates.index]
-            rates_list = [float(rate) for rate in rates.values]
+            column = df[currency]
+            present = column.notna().to_numpy()
+            dates = all_dates[present].tolist()
+            rates_list = round_rates(column.to_numpy()[present]).tolist()
             
             currency_data = CurrencyData(
                 currency=currency,
@@ -469,8 +723,8 @@ def build_currency_response(df: pd.DataFrame, currencies: List[str]) -> Currency
         errors=failed_currencies if failed_currencies else None
     )
 
-@app.post("/exchange-rates", response_model=CurrencyResponse)
-def get_exchange_rates(request: CurrencyRequest):
+@app.post("/exchange-rates")
+async def get_exchange_rates(request: CurrencyRequest):
     """
     Fetch historical exchange rates for specified currencies against USD
     """
@@ -497,96 +751,28 @@ def get_exchange_rates(request: CurrencyRequest):
             )
         
         # Fetch data for all currencies at once
-        df = fetch_currency_data(request.currencies, request.start_date, request.end_date)
+        df = await fetch_currency_data(request.currencies, request.start_date, request.end_date)
         
         if df.empty:
-            return CurrencyResponse(
+            return ORJSONResponse(CurrencyResponse(
                 data=[],
                 status="error",
                 message="No data found for the specified criteria",
                 errors=["Failed to fetch data from Frankfurter API"]
-            )
+            ))
         
         # Resample based on interval
         df = resample_data(df, request.interval)
         
         if df.empty:
-            return CurrencyResponse(
+            return ORJSONResponse(CurrencyResponse(
                 data=[],
                 status="error",
                 message="No data available after resampling",
                 errors=["Data is empty after applying the selected interval"]
-            )
-        
-        result_data = []
-        failed_currencies = []
-        
-        # Process each currency
-        for currency in request.currencies:
-            try:
-                if currency not in df.columns:
-                    failed_currencies.append(f"{currency} (Not available in API response)")
-                    print(f"Currency {currency} not in data")
-                    continue
-                
-                # Extract rates for this currency
-                rates = df[currency].dropna()
-                
-                if len(rates) == 0:
-                    failed_currencies.append(f"{currency} (Empty dataset)")
-                    continue
-                
-                # Calculate statistics
-                start_rate = float(rates.iloc[0])
-                end_rate = float(rates.iloc[-1])
-                percentage_change = ((end_rate - start_rate) / start_rate) * 100
-                min_rate = float(rates.min())
-                max_rate = float(rates.max())
-                
-                # Format dates and rates
-                dates = [date.strftime("%Y-%m-%d") for date in rates.index]
-                rates_list = [float(rate) for rate in rates.values]
-                
-                currency_data = CurrencyData(
-                    currency=currency,
-                    dates=dates,
-                    rates=rates_list,
-                    start_rate=start_rate,
-                    end_rate=end_rate,
-                    percentage_change=round(percentage_change, 2),
-                    min_rate=min_rate,
-                    max_rate=max_rate
-                )
-                
-                result_data.append(currency_data)
-                print(f"Successfully processed {currency}: {len(dates)} data points")
-                
-            except Exception as e:
-                error_msg = f"{currency} ({str(e)[:100]})"
-                failed_currencies.append(error_msg)
-                print(f"Error processing {currency}: {str(e)}")
-                continue
-        
-        # Prepare response
-        if not result_data:
-            return CurrencyResponse(
-                data=[],
-                status="error",
-                message="No data found for any of the specified currencies",
-                errors=failed_currencies if failed_currencies else None
-            )
+            ))
         
-        # Prepare success message
-        success_msg = f"Successfully retrieved data for {len(result_data)} out of {len(request.currencies)} currencies"
-        
-        # print(result_data)
-
-        return CurrencyResponse(
-            data=result_data,
-            status="success" if not failed_currencies else "partial",
-            message=success_msg,
-            errors=failed_currencies if failed_currencies else None
-        )
+        return ORJSONResponse(build_currency_response(df, request.currencies, "Not available in API response"))
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
@@ -594,7 +780,7 @@ def get_exchange_rates(request: CurrencyRequest):
         print(f"Error in get_exchange_rates: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.post("/analyze-csv", response_model=CurrencyResponse)
+@app.post("/analyze-csv")
 async def analyze_csv(
     file: UploadFile = File(...),
     currencies: str = "",
@@ -604,9 +790,8 @@ async def analyze_csv(
 ):
     """Analyze exchange rates from uploaded CSV file and store in database"""
     try:
-        # Read CSV file
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
+        # Parse the uploaded file in place, off the event loop
+        df = await asyncio.to_thread(pd.read_csv, file.file, dtype={'Currency': 'category', 'Rate': 'float64'})
         
         # Validate CSV format
         required_columns = ['Date', 'Currency', 'Rate']
@@ -620,41 +805,45 @@ async def analyze_csv(
         currency_list = [c.strip() for c in currencies.split(',') if c.strip()] if currencies else df['Currency'].unique().tolist()
         
         # Use date range from CSV if not provided
+        df['Date'] = pd.to_datetime(df['Date'])
         if not start_date:
-            start_date = pd.to_datetime(df['Date']).min().strftime("%Y-%m-%d")
+            start_date = df['Date'].min().strftime("%Y-%m-%d")
         if not end_date:
-            end_date = pd.to_datetime(df['Date']).max().strftime("%Y-%m-%d")
+            end_date = df['Date'].max().strftime("%Y-%m-%d")
         
         # Process the CSV data
         processed_df = process_csv_data(df, currency_list, start_date, end_date)
         
         if processed_df.empty:
-            return CurrencyResponse(
+            return ORJSONResponse(CurrencyResponse(
                 data=[],
                 status="error",
                 message="No data found in CSV for the specified criteria",
                 errors=["Failed to process CSV data"]
-            )
+            ))
         
         # Store in database
         try:
-            store_exchange_rates_in_db(processed_df, file.filename)
+            await asyncio.to_thread(store_exchange_rates_in_db, processed_df, file.filename)
         except Exception as db_error:
             print(f"Warning: Failed to store in database: {str(db_error)}")
             # Continue even if database storage fails
         
+        # Statistics and the response only need float32 precision
+        processed_df = processed_df.astype(RATE_DTYPE)
+        
         # Resample based on interval
         processed_df = resample_data(processed_df, interval)
         
         if processed_df.empty:
-            return CurrencyResponse(
+            return ORJSONResponse(CurrencyResponse(
                 data=[],
                 status="error",
                 message="No data available after resampling",
                 errors=["Data is empty after applying the selected interval"]
-            )
+            ))
         
-        return build_currency_response(processed_df, currency_list)
+        return ORJSONResponse(build_currency_response(processed_df, currency_list))
         
     except Exception as e:
         print(f"Error in analyze_csv: {str(e)}")